@@ -4,438 +4,28 @@ Portfolio HTML Builder - Step 2
 Reads portfolio_data.json and generates an interactive HTML visualization.
 """
 
+import functools
 import json
-
-
-def load_portfolio_data(input_file='portfolio_data.json'):
-    """Load portfolio data from JSON file."""
-    try:
-        with open(input_file, 'r') as f:
-            data = json.load(f)
-        return data
-    except FileNotFoundError:
-        print(f"Error: {input_file} not found!")
-        print("Please run 'python fetch_prices.py' first to generate the data file.")
-        exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON file: {e}")
-        exit(1)
-
-
-def calculate_cost_basis(transactions, exchange_rates):
-    """Calculate total cost basis for each ticker in all three currencies."""
-    import json
-    cost_basis_usd = {}
-    cost_basis_eur = {}
-    cost_basis_pln = {}
-
-    # Load exchange rates for conversion (monthly rates for display currencies)
-    rates = {}
-    try:
-        with open('exchange_rates.csv', 'r') as f:
-            import csv
-            reader = csv.DictReader(f)
-            for row in reader:
-                date = row['date']
-                rates[date] = {}
-                for key, val in row.items():
-                    if key != 'date' and val:
-                        rates[date][key] = float(val)
-    except:
-        pass
-
-    # Get the first available date for fallback conversions
-    first_rate_date = min(rates.keys()) if rates else None
-
-    for transaction in transactions:
-        ticker = transaction['ticker']
-        ticker_currency = transaction.get('ticker_currency', 'USD')
-        local_currency = transaction.get('local_currency', 'PLN')
-        price_in_local = transaction['price_in_local_currency']
-        quantity = transaction['quantity']
-        fees_in_local = transaction['fee_in_local_currency']
-        exchange_rate = transaction['exchange_rate']  # This is ticker_currency to local_currency
-
-        if ticker not in cost_basis_usd:
-            cost_basis_usd[ticker] = 0
-            cost_basis_eur[ticker] = 0
-            cost_basis_pln[ticker] = 0
-
-        # Cost in local currency (PLN)
-        total_cost_pln = (quantity * price_in_local) + fees_in_local
-
-        # Convert to ticker currency using the provided exchange rate
-        total_cost_ticker = total_cost_pln / exchange_rate
-
-        # Now convert from ticker currency to all three display currencies
-        def convert_from_ticker(value, ticker_curr, to_curr):
-            if ticker_curr == to_curr:
-                return value
-            # Use first available monthly rate for ticker->display conversions
-            if first_rate_date:
-                pair_key = f"{ticker_curr}_{to_curr}"
-                if pair_key in rates[first_rate_date]:
-                    return value * rates[first_rate_date][pair_key]
-            return value
-
-        if ticker_currency == 'USD':
-            cost_usd = total_cost_ticker
-            cost_eur = convert_from_ticker(total_cost_ticker, 'USD', 'EUR')
-            cost_pln = total_cost_pln
-        elif ticker_currency == 'EUR':
-            cost_usd = convert_from_ticker(total_cost_ticker, 'EUR', 'USD')
-            cost_eur = total_cost_ticker
-            cost_pln = total_cost_pln
-        else:  # PLN
-            cost_usd = convert_from_ticker(total_cost_ticker, 'PLN', 'USD')
-            cost_eur = convert_from_ticker(total_cost_ticker, 'PLN', 'EUR')
-            cost_pln = total_cost_pln
-
-        cost_basis_usd[ticker] += cost_usd
-        cost_basis_eur[ticker] += cost_eur
-        cost_basis_pln[ticker] += cost_pln
-
-    return cost_basis_usd, cost_basis_eur, cost_basis_pln
-
-
-def calculate_cost_basis_over_time(transactions, dates):
-    """Calculate cost basis for each ticker at each date in all three currencies."""
-    from datetime import datetime
-    import csv
-
-    # Load exchange rates (monthly rates)
-    rates = {}
-    try:
-        with open('exchange_rates.csv', 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                date = row['date']
-                rates[date] = {}
-                for key, val in row.items():
-                    if key != 'date' and val:
-                        rates[date][key] = float(val)
-    except:
-        pass
-
-    # Get the first available date for fallback conversions
-    first_rate_date = min(rates.keys()) if rates else None
-
-    # Convert date strings to datetime for comparison
-    date_objects = [datetime.strptime(d, '%Y-%m-%d') for d in dates]
-
-    cost_basis_timeline_usd = {}
-    cost_basis_timeline_eur = {}
-    cost_basis_timeline_pln = {}
-    for ticker in set(t['ticker'] for t in transactions):
-        cost_basis_timeline_usd[ticker] = []
-        cost_basis_timeline_eur[ticker] = []
-        cost_basis_timeline_pln[ticker] = []
-
-    def convert_from_ticker(value, ticker_curr, to_curr):
-        if ticker_curr == to_curr:
-            return value
-        # Use first available monthly rate for ticker->display conversions
-        if first_rate_date:
-            pair_key = f"{ticker_curr}_{to_curr}"
-            if pair_key in rates[first_rate_date]:
-                return value * rates[first_rate_date][pair_key]
-        return value
-
-    # For each date, sum up all transactions that occurred before or on that date
-    for date, date_obj in zip(dates, date_objects):
-        for ticker in cost_basis_timeline_usd.keys():
-            total_cost_usd = 0
-            total_cost_eur = 0
-            total_cost_pln = 0
-            for transaction in transactions:
-                if transaction['ticker'] == ticker:
-                    trans_date = datetime.strptime(transaction['purchase_date'], '%Y-%m-%d')
-                    if trans_date <= date_obj:
-                        ticker_currency = transaction.get('ticker_currency', 'USD')
-                        price_in_local = transaction['price_in_local_currency']
-                        quantity = transaction['quantity']
-                        fees_in_local = transaction['fee_in_local_currency']
-                        exchange_rate = transaction['exchange_rate']
-
-                        # Cost in local currency (PLN)
-                        cost_pln = (quantity * price_in_local) + fees_in_local
-
-                        # Convert to ticker currency using the provided exchange rate
-                        cost_ticker = cost_pln / exchange_rate
-
-                        # Convert from ticker currency to all three display currencies
-                        if ticker_currency == 'USD':
-                            total_cost_usd += cost_ticker
-                            total_cost_eur += convert_from_ticker(cost_ticker, 'USD', 'EUR')
-                            total_cost_pln += cost_pln
-                        elif ticker_currency == 'EUR':
-                            total_cost_usd += convert_from_ticker(cost_ticker, 'EUR', 'USD')
-                            total_cost_eur += cost_ticker
-                            total_cost_pln += cost_pln
-                        else:  # PLN
-                            total_cost_usd += convert_from_ticker(cost_ticker, 'PLN', 'USD')
-                            total_cost_eur += convert_from_ticker(cost_ticker, 'PLN', 'EUR')
-                            total_cost_pln += cost_pln
-
-            cost_basis_timeline_usd[ticker].append(total_cost_usd)
-            cost_basis_timeline_eur[ticker].append(total_cost_eur)
-            cost_basis_timeline_pln[ticker].append(total_cost_pln)
-
-    return cost_basis_timeline_usd, cost_basis_timeline_eur, cost_basis_timeline_pln
-
-
-def generate_html(data, output_file='portfolio.html'):
-    """Generate HTML page with chart visualization from portfolio data."""
-    portfolio_values = data['portfolio_values']
-    transactions = data['transactions']
-    generated_at = data['generated_at']
-
-    dates = [pv['date'] for pv in portfolio_values]
-    values_usd = [pv.get('total_value_usd', 0) for pv in portfolio_values]
-    values_eur = [pv.get('total_value_eur', 0) for pv in portfolio_values]
-    values_pln = [pv.get('total_value_pln', 0) for pv in portfolio_values]
-
-    # Calculate cost basis for each ticker in all three currencies
-    cost_basis_usd, cost_basis_eur, cost_basis_pln = calculate_cost_basis(transactions, None)
-
-    # Calculate cost basis over time for profit calculation
-    cost_basis_timeline_usd, cost_basis_timeline_eur, cost_basis_timeline_pln = calculate_cost_basis_over_time(transactions, dates)
-
-    # Extract unique tickers and prepare per-ticker data
-    all_tickers = set()
-    for pv in portfolio_values:
-        for holding in pv['holdings']:
-            all_tickers.add(holding['ticker'])
-
-    unique_tickers = sorted(list(all_tickers))
-
-    # Color palette for tickers
-    colors = [
-        'rgb(255, 99, 132)',   # Red
-        'rgb(54, 162, 235)',   # Blue
-        'rgb(255, 206, 86)',   # Yellow
-        'rgb(75, 192, 192)',   # Teal
-        'rgb(153, 102, 255)',  # Purple
-        'rgb(255, 159, 64)',   # Orange
-        'rgb(199, 199, 199)',  # Grey
-        'rgb(83, 102, 255)',   # Indigo
-        'rgb(255, 99, 255)',   # Pink
-        'rgb(99, 255, 132)',   # Green
-    ]
-
-    # Build per-ticker datasets (value and profit in all three currencies)
-    ticker_datasets = []
-    ticker_profit_datasets = []
-    for idx, ticker in enumerate(unique_tickers):
-        ticker_values_usd = []
-        ticker_values_eur = []
-        ticker_values_pln = []
-        ticker_profits_usd = []
-        ticker_profits_eur = []
-        ticker_profits_pln = []
-        ticker_quantities = []
-        for i, pv in enumerate(portfolio_values):
-            ticker_value_usd = 0
-            ticker_value_eur = 0
-            ticker_value_pln = 0
-            ticker_quantity = 0
-            for holding in pv['holdings']:
-                if holding['ticker'] == ticker:
-                    ticker_value_usd = holding.get('value_usd', 0)
-                    ticker_value_eur = holding.get('value_eur', 0)
-                    ticker_value_pln = holding.get('value_pln', 0)
-                    ticker_quantity = holding['quantity']
-                    break
-            ticker_values_usd.append(ticker_value_usd)
-            ticker_values_eur.append(ticker_value_eur)
-            ticker_values_pln.append(ticker_value_pln)
-            ticker_quantities.append(ticker_quantity)
-
-            # Calculate profit at this point in time (all three currencies)
-            ticker_cost_usd = cost_basis_timeline_usd[ticker][i]
-            ticker_profit_usd = ticker_value_usd - ticker_cost_usd
-            ticker_profits_usd.append(ticker_profit_usd)
-
-            ticker_cost_eur = cost_basis_timeline_eur[ticker][i]
-            ticker_profit_eur = ticker_value_eur - ticker_cost_eur
-            ticker_profits_eur.append(ticker_profit_eur)
-
-            ticker_cost_pln = cost_basis_timeline_pln[ticker][i]
-            ticker_profit_pln = ticker_value_pln - ticker_cost_pln
-            ticker_profits_pln.append(ticker_profit_pln)
-
-        color = colors[idx % len(colors)]
-        color_rgba = color.replace('rgb', 'rgba').replace(')', ', 0.2)')
-
-        # Value dataset (default to PLN)
-        ticker_datasets.append({
-            'label': ticker,
-            'data': ticker_values_pln,
-            'dataUSD': ticker_values_usd,
-            'dataEUR': ticker_values_eur,
-            'dataPLN': ticker_values_pln,
-            'borderColor': color,
-            'backgroundColor': color_rgba,
-            'tension': 0.1,
-            'fill': True,
-            'tickerName': ticker,
-            'quantities': ticker_quantities,
-            'profits': ticker_profits_pln,
-            'profitsUSD': ticker_profits_usd,
-            'profitsEUR': ticker_profits_eur,
-            'profitsPLN': ticker_profits_pln
-        })
-
-        # Profit dataset (dashed line, same color but darker, default to PLN)
-        darker_color = color.replace('rgb', 'rgba').replace(')', ', 0.8)')
-        ticker_profit_datasets.append({
-            'label': f'{ticker} Profit',
-            'data': ticker_profits_pln,
-            'dataUSD': ticker_profits_usd,
-            'dataEUR': ticker_profits_eur,
-            'dataPLN': ticker_profits_pln,
-            'borderColor': darker_color,
-            'backgroundColor': 'transparent',
-            'tension': 0.1,
-            'fill': False,
-            'borderDash': [5, 5],
-            'borderWidth': 2,
-            'tickerName': ticker,
-            'isProfit': True,
-            'hidden': False,
-            'order': 2,
-            'quantities': ticker_quantities
-        })
-
-    # Calculate total profit over time and total quantities (all three currencies)
-    total_profit_values_usd = []
-    total_profit_values_eur = []
-    total_profit_values_pln = []
-    total_quantities = []
-    for i, pv in enumerate(portfolio_values):
-        # Sum up all cost basis at this point in time (USD)
-        total_cost_at_date_usd = sum(cost_basis_timeline_usd[ticker][i] for ticker in unique_tickers)
-        total_profit_at_date_usd = pv.get('total_value_usd', 0) - total_cost_at_date_usd
-        total_profit_values_usd.append(total_profit_at_date_usd)
-
-        # Sum up all cost basis at this point in time (EUR)
-        total_cost_at_date_eur = sum(cost_basis_timeline_eur[ticker][i] for ticker in unique_tickers)
-        total_profit_at_date_eur = pv.get('total_value_eur', 0) - total_cost_at_date_eur
-        total_profit_values_eur.append(total_profit_at_date_eur)
-
-        # Sum up all cost basis at this point in time (PLN)
-        total_cost_at_date_pln = sum(cost_basis_timeline_pln[ticker][i] for ticker in unique_tickers)
-        total_profit_at_date_pln = pv.get('total_value_pln', 0) - total_cost_at_date_pln
-        total_profit_values_pln.append(total_profit_at_date_pln)
-
-        # Sum up all quantities at this point in time
-        total_qty = sum(holding['quantity'] for holding in pv['holdings'])
-        total_quantities.append(total_qty)
-
-    # Prepare transaction annotations for chart
-    # Find the closest chart date for each transaction
-    from datetime import datetime
-    transaction_annotations = []
-
-    for idx, transaction in enumerate(transactions):
-        trans_date = datetime.strptime(transaction['purchase_date'], '%Y-%m-%d')
-
-        # Find the closest date in the chart dates that's >= transaction date
-        closest_date = None
-        for chart_date in dates:
-            chart_date_obj = datetime.strptime(chart_date, '%Y-%m-%d')
-            if chart_date_obj >= trans_date:
-                closest_date = chart_date
-                break
-
-        # If we couldn't find a date >= transaction date, use the first date
-        if closest_date is None:
-            closest_date = dates[0] if dates else transaction['purchase_date']
-
-        transaction_annotations.append({
-            'type': 'line',
-            'xMin': closest_date,
-            'xMax': closest_date,
-            'borderColor': 'rgba(255, 99, 71, 0.5)',
-            'borderWidth': 2,
-            'borderDash': [5, 5],
-            'ticker': transaction['ticker'],
-            'label': {
-                'display': True,
-                'content': f"{transaction['ticker']}: +{transaction['quantity']:.0f}",
-                'position': 'start',
-                'backgroundColor': 'rgba(255, 99, 71, 0.8)',
-                'color': 'white',
-                'font': {
-                    'size': 10,
-                    'weight': 'bold'
-                },
-                'padding': 4,
-                'rotation': 0
-            }
-        })
-
-    # Calculate statistics for total portfolio (all three currencies)
-    current_value_usd = values_usd[-1] if values_usd else 0
-    current_value_eur = values_eur[-1] if values_eur else 0
-    current_value_pln = values_pln[-1] if values_pln else 0
-
-    # Calculate total cost basis and profit (USD)
-    total_cost_basis_usd = sum(cost_basis_usd.values())
-    total_profit_usd = current_value_usd - total_cost_basis_usd
-    total_profit_percent_usd = ((total_profit_usd / total_cost_basis_usd * 100) if total_cost_basis_usd != 0 else 0)
-
-    # Calculate total cost basis and profit (EUR)
-    total_cost_basis_eur = sum(cost_basis_eur.values())
-    total_profit_eur = current_value_eur - total_cost_basis_eur
-    total_profit_percent_eur = ((total_profit_eur / total_cost_basis_eur * 100) if total_cost_basis_eur != 0 else 0)
-
-    # Calculate total cost basis and profit (PLN)
-    total_cost_basis_pln = sum(cost_basis_pln.values())
-    total_profit_pln = current_value_pln - total_cost_basis_pln
-    total_profit_percent_pln = ((total_profit_pln / total_cost_basis_pln * 100) if total_cost_basis_pln != 0 else 0)
-
-    # Calculate per-ticker statistics (all three currencies)
-    ticker_stats = {}
-    if portfolio_values:
-        current_holdings = portfolio_values[-1]['holdings']
-        for holding in current_holdings:
-            ticker = holding['ticker']
-
-            # USD
-            ticker_cost_usd = cost_basis_usd.get(ticker, 0)
-            ticker_value_usd = holding.get('value_usd', 0)
-            ticker_profit_usd = ticker_value_usd - ticker_cost_usd
-            ticker_return_usd = ((ticker_profit_usd / ticker_cost_usd * 100) if ticker_cost_usd != 0 else 0)
-
-            # EUR
-            ticker_cost_eur = cost_basis_eur.get(ticker, 0)
-            ticker_value_eur = holding.get('value_eur', 0)
-            ticker_profit_eur = ticker_value_eur - ticker_cost_eur
-            ticker_return_eur = ((ticker_profit_eur / ticker_cost_eur * 100) if ticker_cost_eur != 0 else 0)
-
-            # PLN
-            ticker_cost_pln = cost_basis_pln.get(ticker, 0)
-            ticker_value_pln = holding.get('value_pln', 0)
-            ticker_profit_pln = ticker_value_pln - ticker_cost_pln
-            ticker_return_pln = ((ticker_profit_pln / ticker_cost_pln * 100) if ticker_cost_pln != 0 else 0)
-
-            ticker_stats[ticker] = {
-                'current_value_usd': ticker_value_usd,
-                'cost_basis_usd': ticker_cost_usd,
-                'profit_usd': ticker_profit_usd,
-                'return_percent_usd': ticker_return_usd,
-                'current_value_eur': ticker_value_eur,
-                'cost_basis_eur': ticker_cost_eur,
-                'profit_eur': ticker_profit_eur,
-                'return_percent_eur': ticker_return_eur,
-                'current_value_pln': ticker_value_pln,
-                'cost_basis_pln': ticker_cost_pln,
-                'profit_pln': ticker_profit_pln,
-                'return_percent_pln': ticker_return_pln
-            }
-
-    html_content = f"""<!DOCTYPE html>
+import sys
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime
+from itertools import accumulate
+from string import Formatter
+
+from portfolio_core import load_wide_csv
+
+try:
+    import orjson
+except ImportError:
+    # orjson is an optional speedup; the standard library json is used without it
+    orjson = None
+
+# Escapes user-provided text (tickers, dates, currencies) for HTML in one str.translate pass
+HTML_ESCAPE_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'})
+
+# Page templates, rendered in order with str.format_map (CSS/JS braces are doubled)
+PAGE_HEADER_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -629,12 +219,10 @@ def generate_html(data, output_file='portfolio.html'):
                 <option value="total">Total Portfolio Only</option>
 """
 
-    # Add ticker options to dropdown
-    for ticker in unique_tickers:
-        html_content += f"""                <option value="{ticker}">{ticker}</option>
+TICKER_OPTION_TEMPLATE = """                <option value="{ticker}">{ticker}</option>
 """
 
-    html_content += f"""            </select>
+SUMMARY_TEMPLATE = """            </select>
             <label class="filter-label" for="currencyFilter">Currency:</label>
             <select id="currencyFilter" class="filter-dropdown">
                 <option value="PLN">PLN</option>
@@ -663,19 +251,19 @@ def generate_html(data, output_file='portfolio.html'):
         <div class="stats">
             <div class="stat-box">
                 <div class="stat-label">Current Value</div>
-                <div class="stat-value" id="statCurrentValue">{current_value_pln:,.2f} PLN</div>
+                <div class="stat-value" id="statCurrentValue">{current_value:,.2f} PLN</div>
             </div>
             <div class="stat-box">
                 <div class="stat-label">Total Cost</div>
-                <div class="stat-value" id="statTotalCost">{total_cost_basis_pln:,.2f} PLN</div>
+                <div class="stat-value" id="statTotalCost">{total_cost:,.2f} PLN</div>
             </div>
             <div class="stat-box">
                 <div class="stat-label">Total Profit/Loss</div>
-                <div class="stat-value {'positive' if total_profit_pln >= 0 else 'negative'}" id="statProfit">{total_profit_pln:+,.2f} PLN</div>
+                <div class="stat-value {profit_class}" id="statProfit">{total_profit:+,.2f} PLN</div>
             </div>
             <div class="stat-box">
                 <div class="stat-label">Return</div>
-                <div class="stat-value {'positive' if total_profit_percent_pln >= 0 else 'negative'}" id="statReturn">{total_profit_percent_pln:+.2f}%</div>
+                <div class="stat-value {return_class}" id="statReturn">{return_percent:+.2f}%</div>
             </div>
         </div>
 
@@ -696,30 +284,18 @@ def generate_html(data, output_file='portfolio.html'):
                 <tbody>
 """
 
-    # Add current holdings to table (using PLN as default)
-    if portfolio_values:
-        current_holdings = portfolio_values[-1]['holdings']
-        for holding in current_holdings:
-            ticker = holding['ticker']
-            ticker_cost_pln = cost_basis_pln.get(ticker, 0)
-            ticker_value_pln = holding.get('value_pln', 0)
-            ticker_price_pln = holding.get('price_pln', 0)
-            ticker_profit_pln = ticker_value_pln - ticker_cost_pln
-            ticker_return_pln = ((ticker_profit_pln / ticker_cost_pln * 100) if ticker_cost_pln != 0 else 0)
-            profit_class = 'positive' if ticker_profit_pln >= 0 else 'negative'
-
-            html_content += f"""                    <tr>
+HOLDING_ROW_TEMPLATE = """                    <tr>
                         <td class="ticker">{ticker}</td>
-                        <td>{holding['quantity']}</td>
-                        <td>{ticker_cost_pln:,.2f} PLN</td>
-                        <td>{ticker_price_pln:,.2f} PLN</td>
-                        <td>{ticker_value_pln:,.2f} PLN</td>
-                        <td class="{profit_class}">{ticker_profit_pln:+,.2f} PLN</td>
-                        <td class="{profit_class}">{ticker_return_pln:+.2f}%</td>
+                        <td>{quantity}</td>
+                        <td>{cost:,.2f} PLN</td>
+                        <td>{price:,.2f} PLN</td>
+                        <td>{value:,.2f} PLN</td>
+                        <td class="{profit_class}">{profit:+,.2f} PLN</td>
+                        <td class="{profit_class}">{return_percent:+.2f}%</td>
                     </tr>
 """
 
-    html_content += f"""                </tbody>
+TRANSACTIONS_TABLE_TEMPLATE = """                </tbody>
             </table>
         </div>
 
@@ -741,59 +317,19 @@ def generate_html(data, output_file='portfolio.html'):
                 <tbody>
 """
 
-    # Load exchange rates for transaction cost conversion
-    import csv as csv_module
-    rates = {}
-    try:
-        with open('exchange_rates.csv', 'r') as f:
-            reader = csv_module.DictReader(f)
-            for row in reader:
-                date = row['date']
-                rates[date] = {}
-                for key, val in row.items():
-                    if key != 'date' and val:
-                        rates[date][key] = float(val)
-    except:
-        pass
-
-    def convert_to_pln(value, from_curr, date):
-        if from_curr == 'PLN':
-            return value
-        pair_key = f"{from_curr}_PLN"
-        if date in rates and pair_key in rates[date]:
-            return value * rates[date][pair_key]
-        return value
-
-    # Add transactions to table
-    for transaction in transactions:
-        ticker_currency = transaction.get('ticker_currency', 'USD')
-        local_currency = transaction.get('local_currency', 'PLN')
-        purchase_date = transaction['purchase_date']
-        quantity = transaction['quantity']
-        price_in_local = transaction['price_in_local_currency']
-        fee_in_local = transaction['fee_in_local_currency']
-        exchange_rate = transaction['exchange_rate']
-
-        # Calculate costs
-        total_cost_pln = (quantity * price_in_local) + fee_in_local
-        # Calculate price and fee in ticker currency using the exchange rate
-        price_in_ticker = price_in_local / exchange_rate
-        fee_in_ticker = fee_in_local / exchange_rate
-        total_cost_ticker = (quantity * price_in_ticker) + fee_in_ticker
-
-        html_content += f"""                    <tr>
-                        <td class="ticker">{transaction['ticker']}</td>
+TRANSACTION_ROW_TEMPLATE = """                    <tr>
+                        <td class="ticker">{ticker}</td>
                         <td>{purchase_date}</td>
                         <td>{quantity}</td>
-                        <td><strong>{ticker_currency}</strong></td>
-                        <td>{price_in_ticker:,.2f} {ticker_currency}</td>
-                        <td>{fee_in_ticker:,.2f} {ticker_currency}</td>
-                        <td>{total_cost_ticker:,.2f} {ticker_currency}</td>
+                        <td><strong>{currency}</strong></td>
+                        <td>{price:,.2f} {currency}</td>
+                        <td>{fee:,.2f} {currency}</td>
+                        <td>{total_cost:,.2f} {currency}</td>
                         <td>{total_cost_pln:,.2f} PLN</td>
                     </tr>
 """
 
-    html_content += f"""                </tbody>
+PAGE_SCRIPT_TEMPLATE = """                </tbody>
             </table>
         </div>
     </div>
@@ -804,39 +340,79 @@ def generate_html(data, output_file='portfolio.html'):
         // Currency settings (must be declared before chart creation)
         let currentCurrency = 'PLN';
 
+        // Number formatters with thousands separators, created once and shared by all labels.
+        // Intl rounds halfway values on their decimal digits, so e.g. 1.005 shows as "1.01"
+        // where the old toFixed() gave "1.00" - at most one cent (or one unit) apart
+        const formatNumber2 = new Intl.NumberFormat('en-US', {{ minimumFractionDigits: 2, maximumFractionDigits: 2 }});
+        const formatNumber0 = new Intl.NumberFormat('en-US', {{ maximumFractionDigits: 0 }});
+
+        // Money amounts as shown in tooltips, labels and stats, e.g. "1,234.56 PLN" / "+1,234.56 PLN"
+        function formatMoney(value, currency) {{
+            return formatNumber2.format(value) + ' ' + currency;
+        }}
+
+        function formatSignedMoney(value, currency) {{
+            return (value >= 0 ? '+' : '') + formatNumber2.format(value) + ' ' + currency;
+        }}
+
         // Ticker value datasets
-        const tickerValueDatasets = {json.dumps(ticker_datasets)};
+        const tickerValueDatasets = {ticker_datasets_json};
 
         // Ticker profit datasets
-        const tickerProfitDatasets = {json.dumps(ticker_profit_datasets)};
+        const tickerProfitDatasets = {ticker_profit_datasets_json};
+
+        // PLN is the default currency, so the PLN series are the data/profits arrays
+        tickerValueDatasets.forEach(dataset => {{
+            dataset.dataPLN = dataset.data;
+            dataset.profitsPLN = dataset.profits;
+        }});
+
+        // Profit datasets reuse the profit series of the matching value dataset
+        tickerProfitDatasets.forEach((dataset, i) => {{
+            const valueDataset = tickerValueDatasets[i];
+            dataset.data = valueDataset.profitsPLN;
+            dataset.dataUSD = valueDataset.profitsUSD;
+            dataset.dataEUR = valueDataset.profitsEUR;
+            dataset.dataPLN = valueDataset.profitsPLN;
+            dataset.quantities = valueDataset.quantities;
+        }});
+
+        // Total portfolio series, each embedded once and shared by both total datasets
+        const totalValuesUSD = {values_usd_json};
+        const totalValuesEUR = {values_eur_json};
+        const totalValuesPLN = {values_pln_json};
+        const totalProfitsUSD = {total_profit_values_usd_json};
+        const totalProfitsEUR = {total_profit_values_eur_json};
+        const totalProfitsPLN = {total_profit_values_pln_json};
+        const totalQuantities = {total_quantities_json};
 
         // Total portfolio value dataset
         const totalValueDataset = {{
             label: 'Total Portfolio',
-            data: {json.dumps(values_pln)},
-            dataUSD: {json.dumps(values_usd)},
-            dataEUR: {json.dumps(values_eur)},
-            dataPLN: {json.dumps(values_pln)},
+            data: totalValuesPLN,
+            dataUSD: totalValuesUSD,
+            dataEUR: totalValuesEUR,
+            dataPLN: totalValuesPLN,
             borderColor: 'rgb(0, 0, 0)',
             backgroundColor: 'rgba(0, 0, 0, 0.1)',
             tension: 0.1,
             fill: true,
             borderWidth: 3,
             tickerName: 'total',
-            quantities: {json.dumps(total_quantities)},
-            profits: {json.dumps(total_profit_values_pln)},
-            profitsUSD: {json.dumps(total_profit_values_usd)},
-            profitsEUR: {json.dumps(total_profit_values_eur)},
-            profitsPLN: {json.dumps(total_profit_values_pln)}
+            quantities: totalQuantities,
+            profits: totalProfitsPLN,
+            profitsUSD: totalProfitsUSD,
+            profitsEUR: totalProfitsEUR,
+            profitsPLN: totalProfitsPLN
         }};
 
         // Total portfolio profit dataset
         const totalProfitDataset = {{
             label: 'Total Portfolio Profit',
-            data: {json.dumps(total_profit_values_pln)},
-            dataUSD: {json.dumps(total_profit_values_usd)},
-            dataEUR: {json.dumps(total_profit_values_eur)},
-            dataPLN: {json.dumps(total_profit_values_pln)},
+            data: totalProfitsPLN,
+            dataUSD: totalProfitsUSD,
+            dataEUR: totalProfitsEUR,
+            dataPLN: totalProfitsPLN,
             borderColor: 'rgba(0, 0, 0, 0.8)',
             backgroundColor: 'transparent',
             tension: 0.1,
@@ -847,13 +423,23 @@ def generate_html(data, output_file='portfolio.html'):
             isProfit: true,
             hidden: false,
             order: 2,
-            quantities: {json.dumps(total_quantities)}
+            quantities: totalQuantities
         }};
 
+        // Store all annotations, plus the same annotations grouped by ticker for the filter
+        const allAnnotations = {transaction_annotations_json};
+        const annotationsByTicker = {{}};
+        allAnnotations.forEach(ann => {{
+            if (!annotationsByTicker[ann.ticker]) {{
+                annotationsByTicker[ann.ticker] = [];
+            }}
+            annotationsByTicker[ann.ticker].push(ann);
+        }});
+
         const chart = new Chart(ctx, {{
             type: 'line',
             data: {{
-                labels: {json.dumps(dates)},
+                labels: {dates_json},
                 datasets: [...tickerValueDatasets, ...tickerProfitDatasets, totalValueDataset, totalProfitDataset]
             }},
             options: {{
@@ -897,7 +483,7 @@ def generate_html(data, output_file='portfolio.html'):
                                 const dataIndex = context.dataIndex;
                                 const value = context.parsed.y;
                                 const currency = currentCurrency;
-                                const formattedValue = value.toFixed(2).replace(/\\B(?=(\\d{{3}})+(?!\\d))/g, ',') + ' ' + currency;
+                                const formattedValue = formatMoney(value, currency);
 
                                 let lines = [];
 
@@ -915,9 +501,7 @@ def generate_html(data, output_file='portfolio.html'):
                                     }}
                                     if (dataset.profits && dataset.profits[dataIndex] !== undefined) {{
                                         const profit = dataset.profits[dataIndex];
-                                        const profitSign = profit >= 0 ? '+' : '';
-                                        const formattedProfit = profitSign + profit.toFixed(2).replace(/\\B(?=(\\d{{3}})+(?!\\d))/g, ',') + ' ' + currency;
-                                        lines.push('  Profit: ' + formattedProfit);
+                                        lines.push('  Profit: ' + formatSignedMoney(profit, currency));
                                     }}
                                 }}
 
@@ -926,7 +510,7 @@ def generate_html(data, output_file='portfolio.html'):
                         }}
                     }},
                     annotation: {{
-                        annotations: {json.dumps(transaction_annotations)}
+                        annotations: allAnnotations
                     }}
                 }},
                 scales: {{
@@ -935,7 +519,7 @@ def generate_html(data, output_file='portfolio.html'):
                         ticks: {{
                             callback: function(value) {{
                                 const currency = currentCurrency;
-                                return value.toFixed(0).replace(/\\B(?=(\\d{{3}})+(?!\\d))/g, ',') + ' ' + currency;
+                                return formatNumber0.format(value) + ' ' + currency;
                             }}
                         }}
                     }},
@@ -949,11 +533,8 @@ def generate_html(data, output_file='portfolio.html'):
             }}
         }});
 
-        // Store all annotations
-        const allAnnotations = {json.dumps(transaction_annotations)};
-
         // Store ticker statistics (all three currencies)
-        const tickerStats = {json.dumps(ticker_stats)};
+        const tickerStats = {ticker_stats_json};
         const totalStats = {{
             current_value_usd: {current_value_usd},
             cost_basis_usd: {total_cost_basis_usd},
@@ -970,25 +551,34 @@ def generate_html(data, output_file='portfolio.html'):
         }};
 
         // Function to update stats display
+        // Elements updated on every filter or currency change, looked up once
+        const tickerFilter = document.getElementById('tickerFilter');
+        const currencyFilter = document.getElementById('currencyFilter');
+        const statsElements = {{
+            label: document.getElementById('statsLabel'),
+            currentValue: document.getElementById('statCurrentValue'),
+            totalCost: document.getElementById('statTotalCost'),
+            profit: document.getElementById('statProfit'),
+            return: document.getElementById('statReturn')
+        }};
+
         function updateStats(label, stats) {{
             const currency = currentCurrency;
-            const suffix = ' ' + currency;
 
             const currentValue = stats['current_value_' + currency.toLowerCase()];
             const costBasis = stats['cost_basis_' + currency.toLowerCase()];
             const profit = stats['profit_' + currency.toLowerCase()];
             const returnPercent = stats['return_percent_' + currency.toLowerCase()];
 
-            document.getElementById('statsLabel').textContent = label;
-            document.getElementById('statCurrentValue').textContent = currentValue.toFixed(2).replace(/\\B(?=(\\d{{3}})+(?!\\d))/g, ',') + suffix;
-            document.getElementById('statTotalCost').textContent = costBasis.toFixed(2).replace(/\\B(?=(\\d{{3}})+(?!\\d))/g, ',') + suffix;
+            statsElements.label.textContent = label;
+            statsElements.currentValue.textContent = formatMoney(currentValue, currency);
+            statsElements.totalCost.textContent = formatMoney(costBasis, currency);
 
-            const profitElement = document.getElementById('statProfit');
-            const profitSign = profit >= 0 ? '+' : '';
-            profitElement.textContent = profitSign + profit.toFixed(2).replace(/\\B(?=(\\d{{3}})+(?!\\d))/g, ',') + suffix;
+            const profitElement = statsElements.profit;
+            profitElement.textContent = formatSignedMoney(profit, currency);
             profitElement.className = 'stat-value ' + (profit >= 0 ? 'positive' : 'negative');
 
-            const returnElement = document.getElementById('statReturn');
+            const returnElement = statsElements.return;
             const returnSign = returnPercent >= 0 ? '+' : '';
             returnElement.textContent = returnSign + returnPercent.toFixed(2) + '%';
             returnElement.className = 'stat-value ' + (returnPercent >= 0 ? 'positive' : 'negative');
@@ -1013,7 +603,7 @@ def generate_html(data, output_file='portfolio.html'):
             chart.update();
 
             // Update stats based on current filter
-            const selectedTicker = document.getElementById('tickerFilter').value;
+            const selectedTicker = tickerFilter.value;
             if (selectedTicker === 'all' || selectedTicker === 'total') {{
                 updateStats(selectedTicker === 'all' ? 'All Tickers' : 'Total Portfolio Only', totalStats);
             }} else {{
@@ -1022,7 +612,7 @@ def generate_html(data, output_file='portfolio.html'):
         }}
 
         // Dropdown filter functionality
-        document.getElementById('tickerFilter').addEventListener('change', function(e) {{
+        tickerFilter.addEventListener('change', function(e) {{
             const selectedTicker = e.target.value;
 
             if (selectedTicker === 'all') {{
@@ -1045,7 +635,7 @@ def generate_html(data, output_file='portfolio.html'):
                 const tickerProfitDs = tickerProfitDatasets.filter(ds => ds.tickerName === selectedTicker);
                 chart.data.datasets = [...tickerValueDs, ...tickerProfitDs];
                 // Show only annotations for selected ticker
-                chart.options.plugins.annotation.annotations = allAnnotations.filter(ann => ann.ticker === selectedTicker);
+                chart.options.plugins.annotation.annotations = annotationsByTicker[selectedTicker] || [];
                 // Update stats to show selected ticker
                 updateStats(selectedTicker, tickerStats[selectedTicker]);
             }}
@@ -1054,7 +644,7 @@ def generate_html(data, output_file='portfolio.html'):
         }});
 
         // Currency filter functionality
-        document.getElementById('currencyFilter').addEventListener('change', function(e) {{
+        currencyFilter.addEventListener('change', function(e) {{
             const selectedCurrency = e.target.value;
             switchCurrency(selectedCurrency);
             // Update pie chart with new currency
@@ -1063,7 +653,7 @@ def generate_html(data, output_file='portfolio.html'):
 
         // Pie chart setup
         const pieCtx = document.getElementById('pieChart').getContext('2d');
-        const portfolioData = {json.dumps(portfolio_values)};
+        const portfolioData = {portfolio_values_json};
         let currentDateIndex = portfolioData.length - 1; // Start with latest date
 
         // Color palette for pie chart
@@ -1112,7 +702,7 @@ def generate_html(data, output_file='portfolio.html'):
                                 const total = context.dataset.data.reduce((a, b) => a + b, 0);
                                 const percentage = ((value / total) * 100).toFixed(1);
                                 const currency = currentCurrency;
-                                return label + ': ' + value.toFixed(2).replace(/\\B(?=(\\d{{3}})+(?!\\d))/g, ',') + ' ' + currency + ' (' + percentage + '%)';
+                                return label + ': ' + formatMoney(value, currency) + ' (' + percentage + '%)';
                             }}
                         }}
                     }}
@@ -1178,8 +768,491 @@ def generate_html(data, output_file='portfolio.html'):
 </html>
 """
 
-    with open(output_file, 'w') as f:
-        f.write(html_content)
+
+# The script section embeds several large JSON payloads, so it is pre-split into
+# (literal text, field, format spec) pieces and written out piece by piece
+PAGE_SCRIPT_PARTS = [(literal, field, spec) for literal, field, spec, _ in Formatter().parse(PAGE_SCRIPT_TEMPLATE)]
+
+
+def write_template(f, parts, values):
+    """Write pre-split template parts filled from values to the file f."""
+    for literal, field, spec in parts:
+        f.write(literal)
+        if field is not None:
+            f.write(format(values[field], spec))
+
+
+def dumps_json(obj):
+    """Serialize obj to compact JSON text, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def load_portfolio_data(input_file='portfolio_data.json'):
+    """Load portfolio data from JSON file."""
+    try:
+        if orjson is not None:
+            with open(input_file, 'rb') as f:
+                data = orjson.loads(f.read())
+        else:
+            with open(input_file, 'r') as f:
+                data = json.load(f)
+        return data
+    except FileNotFoundError:
+        print(f"Error: {input_file} not found!")
+        print("Please run 'python fetch_prices.py' first to generate the data file.")
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        print(f"Error parsing JSON file: {e}")
+        sys.exit(1)
+
+
+@functools.lru_cache(maxsize=1)
+def load_exchange_rates(rates_file='exchange_rates.csv'):
+    """Load exchange rates once per run; returns (rates by date, first rate date)."""
+    try:
+        pair_rates = load_wide_csv(rates_file, missing_ok=True)
+    except (OSError, ValueError):
+        pair_rates = {}
+
+    # Turn the {pair: {date: rate}} cache into {date: {pair: rate}}
+    rates = {}
+    for pair_key, rates_by_date in pair_rates.items():
+        for date, rate in rates_by_date.items():
+            rates.setdefault(date, {})[pair_key] = rate
+
+    # Get the first available date for fallback conversions
+    first_rate_date = min(rates) if rates else None
+    return rates, first_rate_date
+
+
+@functools.lru_cache(maxsize=None)
+def display_currency_factors(ticker_currency):
+    """Return the (USD, EUR) factors converting a ticker_currency amount for display."""
+    # Any ticker currency other than USD or EUR (including a blank one) is converted
+    # with the PLN rates
+    if ticker_currency not in ('USD', 'EUR'):
+        ticker_currency = 'PLN'
+
+    # Ticker->display conversions use the first available monthly rate; a missing
+    # pair (or the same currency) leaves the amount unchanged
+    rates, first_rate_date = load_exchange_rates()
+    first_rates = rates[first_rate_date] if first_rate_date else {}
+    return tuple(
+        1.0 if ticker_currency == display_currency
+        else first_rates.get(f"{ticker_currency}_{display_currency}", 1.0)
+        for display_currency in ('USD', 'EUR')
+    )
+
+
+def display_costs(transaction, total_cost):
+    """Return a transaction's total cost (fees included, in local currency) as a (usd, eur, pln) tuple."""
+    # Cost in local currency (PLN)
+    cost_pln = total_cost
+
+    # Convert to ticker currency using the provided exchange rate (ticker_currency to local_currency)
+    cost_ticker = cost_pln / transaction['exchange_rate']
+
+    # Now convert from ticker currency to all three display currencies
+    usd_factor, eur_factor = display_currency_factors(transaction.get('ticker_currency', 'USD'))
+    return cost_ticker * usd_factor, cost_ticker * eur_factor, cost_pln
+
+
+def calculate_cost_basis(transactions, transaction_costs):
+    """Calculate total cost basis for each ticker as a [usd, eur, pln] list."""
+    cost_basis = defaultdict(lambda: [0.0, 0.0, 0.0])
+
+    for transaction, (cost_usd, cost_eur, cost_pln) in zip(transactions, transaction_costs):
+        ticker_cost_basis = cost_basis[transaction['ticker']]
+        ticker_cost_basis[0] += cost_usd
+        ticker_cost_basis[1] += cost_eur
+        ticker_cost_basis[2] += cost_pln
+
+    return dict(cost_basis)
+
+
+def accumulate_costs(dated_costs, date_ordinals):
+    """Return the running (usd, eur, pln) cost totals of dated_costs at each ordinal date."""
+    # Prefix sums over the date-sorted costs; the total at a date is the prefix sum up
+    # to the last cost dated on or before it
+    dated_costs.sort(key=lambda c: c[0])
+    cost_dates = [c[0] for c in dated_costs]
+    cum_usd = list(accumulate((c[1] for c in dated_costs), initial=0))
+    cum_eur = list(accumulate((c[2] for c in dated_costs), initial=0))
+    cum_pln = list(accumulate((c[3] for c in dated_costs), initial=0))
+
+    indices = [bisect_right(cost_dates, ordinal) for ordinal in date_ordinals]
+    return [cum_usd[i] for i in indices], [cum_eur[i] for i in indices], [cum_pln[i] for i in indices]
+
+
+def calculate_cost_basis_over_time(transactions, purchase_ordinals, transaction_costs, date_ordinals):
+    """Calculate cost basis for each ticker at each (ordinal) date in all three currencies."""
+    # Bucket the transaction costs by ticker
+    by_ticker = defaultdict(list)
+    for transaction, purchase_ordinal, costs in zip(transactions, purchase_ordinals, transaction_costs):
+        by_ticker[transaction['ticker']].append((purchase_ordinal, *costs))
+
+    cost_basis_timeline_usd = {}
+    cost_basis_timeline_eur = {}
+    cost_basis_timeline_pln = {}
+    for ticker, ticker_costs in by_ticker.items():
+        (cost_basis_timeline_usd[ticker],
+         cost_basis_timeline_eur[ticker],
+         cost_basis_timeline_pln[ticker]) = accumulate_costs(ticker_costs, date_ordinals)
+
+    return cost_basis_timeline_usd, cost_basis_timeline_eur, cost_basis_timeline_pln
+
+
+def calculate_total_cost_over_time(transactions, purchase_ordinals, transaction_costs, date_ordinals, tickers):
+    """Calculate the combined cost basis of tickers at each (ordinal) date in all three currencies."""
+    # One sweep over every matching transaction by date, regardless of ticker
+    dated_costs = [(purchase_ordinal, *costs)
+                   for transaction, purchase_ordinal, costs in zip(transactions, purchase_ordinals, transaction_costs)
+                   if transaction['ticker'] in tickers]
+    return accumulate_costs(dated_costs, date_ordinals)
+
+
+def generate_html(data, output_file='portfolio.html'):
+    """Generate HTML page with chart visualization from portfolio data."""
+    portfolio_values = data['portfolio_values']
+    transactions = data['transactions']
+    generated_at = data['generated_at']
+
+    # Purchase date of each transaction as a day ordinal, computed once and reused by
+    # the cost-basis calculations and the chart annotations
+    purchase_ordinals = [datetime.fromisoformat(transaction['purchase_date']).toordinal()
+                         for transaction in transactions]
+
+    # Total cost (including fees) of each transaction in local currency, computed once
+    # and reused by the cost-basis calculations and the transactions table; like the
+    # ordinals, kept alongside the transactions rather than written into them
+    total_costs = [(transaction['quantity'] * transaction['price_in_local_currency']) + transaction['fee_in_local_currency']
+                   for transaction in transactions]
+
+    # Each transaction's cost in the three display currencies, converted once and
+    # shared by all three cost-basis calculations
+    transaction_costs = [display_costs(transaction, total_cost)
+                         for transaction, total_cost in zip(transactions, total_costs)]
+
+    dates = [pv['date'] for pv in portfolio_values]
+    # Chart dates as day ordinals, parsed once for every date comparison below
+    date_ordinals = [datetime.fromisoformat(d).toordinal() for d in dates]
+    values_usd = [pv.get('total_value_usd', 0) for pv in portfolio_values]
+    values_eur = [pv.get('total_value_eur', 0) for pv in portfolio_values]
+    values_pln = [pv.get('total_value_pln', 0) for pv in portfolio_values]
+
+    # Calculate cost basis for each ticker in all three currencies
+    cost_basis = calculate_cost_basis(transactions, transaction_costs)
+
+    # Calculate cost basis over time for profit calculation
+    cost_basis_timeline_usd, cost_basis_timeline_eur, cost_basis_timeline_pln = calculate_cost_basis_over_time(transactions, purchase_ordinals, transaction_costs, date_ordinals)
+
+    # Color palette for tickers (RGB components)
+    colors = [
+        (255, 99, 132),   # Red
+        (54, 162, 235),   # Blue
+        (255, 206, 86),   # Yellow
+        (75, 192, 192),   # Teal
+        (153, 102, 255),  # Purple
+        (255, 159, 64),   # Orange
+        (199, 199, 199),  # Grey
+        (83, 102, 255),   # Indigo
+        (255, 99, 255),   # Pink
+        (99, 255, 132),   # Green
+    ]
+
+    # Index each date's holdings by ticker so per-ticker lookups are dict fetches,
+    # collecting the unique tickers and summing up all quantities at each point
+    # in time in the same pass
+    holdings_by_date = []
+    total_quantities = []
+    all_tickers = set()
+    for pv in portfolio_values:
+        date_holdings = {holding['ticker']: holding for holding in pv['holdings']}
+        holdings_by_date.append(date_holdings)
+        all_tickers.update(date_holdings)
+        total_quantities.append(sum(holding['quantity'] for holding in pv['holdings']))
+
+    unique_tickers = sorted(all_tickers)
+
+    # Build per-ticker datasets (value and profit in all three currencies)
+    ticker_datasets = []
+    ticker_profit_datasets = []
+    for idx, ticker in enumerate(unique_tickers):
+        ticker_values_usd = []
+        ticker_values_eur = []
+        ticker_values_pln = []
+        ticker_quantities = []
+        for date_holdings in holdings_by_date:
+            holding = date_holdings.get(ticker)
+            if holding is not None:
+                ticker_values_usd.append(holding.get('value_usd', 0))
+                ticker_values_eur.append(holding.get('value_eur', 0))
+                ticker_values_pln.append(holding.get('value_pln', 0))
+                ticker_quantities.append(holding['quantity'])
+            else:
+                ticker_values_usd.append(0)
+                ticker_values_eur.append(0)
+                ticker_values_pln.append(0)
+                ticker_quantities.append(0)
+
+        # Calculate profit at each point in time (all three currencies) by pairing
+        # the value series with the ticker's cost basis timeline element-wise
+        timeline_usd = cost_basis_timeline_usd[ticker]
+        timeline_eur = cost_basis_timeline_eur[ticker]
+        timeline_pln = cost_basis_timeline_pln[ticker]
+        ticker_profits_usd = [value - cost for value, cost in zip(ticker_values_usd, timeline_usd)]
+        ticker_profits_eur = [value - cost for value, cost in zip(ticker_values_eur, timeline_eur)]
+        ticker_profits_pln = [value - cost for value, cost in zip(ticker_values_pln, timeline_pln)]
+
+        r, g, b = colors[idx % len(colors)]
+        color = f'rgb({r}, {g}, {b})'
+        color_rgba = f'rgba({r}, {g}, {b}, 0.2)'
+
+        # Value dataset (default to PLN)
+        ticker_datasets.append({
+            'label': ticker,
+            'data': ticker_values_pln,
+            'dataUSD': ticker_values_usd,
+            'dataEUR': ticker_values_eur,
+            'borderColor': color,
+            'backgroundColor': color_rgba,
+            'tension': 0.1,
+            'fill': True,
+            'tickerName': ticker,
+            'quantities': ticker_quantities,
+            'profits': ticker_profits_pln,
+            'profitsUSD': ticker_profits_usd,
+            'profitsEUR': ticker_profits_eur
+        })
+
+        # Profit dataset (dashed line, same color but darker, default to PLN).
+        # Its data and quantities are the value dataset's arrays, attached in the page
+        # script, so each profit series is only embedded once.
+        darker_color = f'rgba({r}, {g}, {b}, 0.8)'
+        ticker_profit_datasets.append({
+            'label': f'{ticker} Profit',
+            'borderColor': darker_color,
+            'backgroundColor': 'transparent',
+            'tension': 0.1,
+            'fill': False,
+            'borderDash': [5, 5],
+            'borderWidth': 2,
+            'tickerName': ticker,
+            'isProfit': True,
+            'hidden': False,
+            'order': 2
+        })
+
+    # Total cost basis at each point in time, over the tickers shown in the chart
+    total_cost_at_date_usd, total_cost_at_date_eur, total_cost_at_date_pln = calculate_total_cost_over_time(
+        transactions, purchase_ordinals, transaction_costs, date_ordinals, all_tickers)
+
+    # Calculate total profit over time (all three currencies)
+    total_profit_values_usd = [value - cost for value, cost in zip(values_usd, total_cost_at_date_usd)]
+    total_profit_values_eur = [value - cost for value, cost in zip(values_eur, total_cost_at_date_eur)]
+    total_profit_values_pln = [value - cost for value, cost in zip(values_pln, total_cost_at_date_pln)]
+
+    # Prepare transaction annotations for chart
+    # Find the closest chart date for each transaction
+    transaction_annotations = []
+
+    # Styling shared by every annotation; only the date, ticker and label text vary
+    # (keys with None are overwritten per transaction, keeping the original key order)
+    annotation_label_template = {
+        'display': True,
+        'content': None,
+        'position': 'start',
+        'backgroundColor': 'rgba(255, 99, 71, 0.8)',
+        'color': 'white',
+        'font': {
+            'size': 10,
+            'weight': 'bold'
+        },
+        'padding': 4,
+        'rotation': 0
+    }
+    annotation_template = {
+        'type': 'line',
+        'xMin': None,
+        'xMax': None,
+        'borderColor': 'rgba(255, 99, 71, 0.5)',
+        'borderWidth': 2,
+        'borderDash': [5, 5],
+        'ticker': None,
+        'label': None
+    }
+
+    for transaction, purchase_ordinal in zip(transactions, purchase_ordinals):
+        # Find the closest date in the chart dates that's >= transaction date
+        # (chart dates are sorted, so binary search instead of scanning)
+        i = bisect_left(date_ordinals, purchase_ordinal)
+        if i < len(dates):
+            closest_date = dates[i]
+        else:
+            # If we couldn't find a date >= transaction date, use the first date
+            closest_date = dates[0] if dates else transaction['purchase_date']
+
+        transaction_annotations.append({
+            **annotation_template,
+            'xMin': closest_date,
+            'xMax': closest_date,
+            'ticker': transaction['ticker'],
+            'label': {**annotation_label_template, 'content': f"{transaction['ticker']}: +{transaction['quantity']:.0f}"}
+        })
+
+    # Calculate statistics for total portfolio (all three currencies)
+    current_value_usd = values_usd[-1] if values_usd else 0
+    current_value_eur = values_eur[-1] if values_eur else 0
+    current_value_pln = values_pln[-1] if values_pln else 0
+
+    # Calculate total cost basis and profit (USD)
+    total_cost_basis_usd = sum(costs[0] for costs in cost_basis.values())
+    total_profit_usd = current_value_usd - total_cost_basis_usd
+    total_profit_percent_usd = ((total_profit_usd / total_cost_basis_usd * 100) if total_cost_basis_usd != 0 else 0)
+
+    # Calculate total cost basis and profit (EUR)
+    total_cost_basis_eur = sum(costs[1] for costs in cost_basis.values())
+    total_profit_eur = current_value_eur - total_cost_basis_eur
+    total_profit_percent_eur = ((total_profit_eur / total_cost_basis_eur * 100) if total_cost_basis_eur != 0 else 0)
+
+    # Calculate total cost basis and profit (PLN)
+    total_cost_basis_pln = sum(costs[2] for costs in cost_basis.values())
+    total_profit_pln = current_value_pln - total_cost_basis_pln
+    total_profit_percent_pln = ((total_profit_pln / total_cost_basis_pln * 100) if total_cost_basis_pln != 0 else 0)
+
+    # Calculate per-ticker statistics (all three currencies)
+    ticker_stats = {}
+    if portfolio_values:
+        current_holdings = portfolio_values[-1]['holdings']
+        for holding in current_holdings:
+            ticker = holding['ticker']
+            ticker_cost_usd, ticker_cost_eur, ticker_cost_pln = cost_basis.get(ticker, (0, 0, 0))
+
+            # USD
+            ticker_value_usd = holding.get('value_usd', 0)
+            ticker_profit_usd = ticker_value_usd - ticker_cost_usd
+            ticker_return_usd = ((ticker_profit_usd / ticker_cost_usd * 100) if ticker_cost_usd != 0 else 0)
+
+            # EUR
+            ticker_value_eur = holding.get('value_eur', 0)
+            ticker_profit_eur = ticker_value_eur - ticker_cost_eur
+            ticker_return_eur = ((ticker_profit_eur / ticker_cost_eur * 100) if ticker_cost_eur != 0 else 0)
+
+            # PLN
+            ticker_value_pln = holding.get('value_pln', 0)
+            ticker_profit_pln = ticker_value_pln - ticker_cost_pln
+            ticker_return_pln = ((ticker_profit_pln / ticker_cost_pln * 100) if ticker_cost_pln != 0 else 0)
+
+            ticker_stats[ticker] = {
+                'current_value_usd': ticker_value_usd,
+                'cost_basis_usd': ticker_cost_usd,
+                'profit_usd': ticker_profit_usd,
+                'return_percent_usd': ticker_return_usd,
+                'current_value_eur': ticker_value_eur,
+                'cost_basis_eur': ticker_cost_eur,
+                'profit_eur': ticker_profit_eur,
+                'return_percent_eur': ticker_return_eur,
+                'current_value_pln': ticker_value_pln,
+                'cost_basis_pln': ticker_cost_pln,
+                'profit_pln': ticker_profit_pln,
+                'return_percent_pln': ticker_return_pln
+            }
+
+    # Stream the page straight to disk chunk by chunk instead of assembling it in memory
+    with open(output_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.write(PAGE_HEADER_TEMPLATE.format_map({'generated_at': generated_at.translate(HTML_ESCAPE_TABLE)}))
+
+        # Add ticker options to dropdown
+        f.writelines(TICKER_OPTION_TEMPLATE.format_map({'ticker': ticker.translate(HTML_ESCAPE_TABLE)})
+                     for ticker in unique_tickers)
+
+        f.write(SUMMARY_TEMPLATE.format_map({
+            'current_value': current_value_pln,
+            'total_cost': total_cost_basis_pln,
+            'total_profit': total_profit_pln,
+            'profit_class': 'positive' if total_profit_pln >= 0 else 'negative',
+            'return_percent': total_profit_percent_pln,
+            'return_class': 'positive' if total_profit_percent_pln >= 0 else 'negative'
+        }))
+
+        # Add current holdings to table (using PLN as default)
+        # (cost, value, profit and return come from the already computed ticker_stats)
+        if portfolio_values:
+            current_holdings = portfolio_values[-1]['holdings']
+            for holding in current_holdings:
+                ticker = holding['ticker']
+                stats = ticker_stats[ticker]
+
+                f.write(HOLDING_ROW_TEMPLATE.format_map({
+                    'ticker': ticker.translate(HTML_ESCAPE_TABLE),
+                    'quantity': holding['quantity'],
+                    'cost': stats['cost_basis_pln'],
+                    'price': holding.get('price_pln', 0),
+                    'value': stats['current_value_pln'],
+                    'profit': stats['profit_pln'],
+                    'return_percent': stats['return_percent_pln'],
+                    'profit_class': 'positive' if stats['profit_pln'] >= 0 else 'negative'
+                }))
+
+        f.write(TRANSACTIONS_TABLE_TEMPLATE)
+
+        # Add transactions to table
+        for transaction, total_cost_pln in zip(transactions, total_costs):
+            ticker_currency = transaction.get('ticker_currency', 'USD')
+            local_currency = transaction.get('local_currency', 'PLN')
+            purchase_date = transaction['purchase_date']
+            quantity = transaction['quantity']
+            price_in_local = transaction['price_in_local_currency']
+            fee_in_local = transaction['fee_in_local_currency']
+            exchange_rate = transaction['exchange_rate']
+
+            # Calculate price and fee in ticker currency using the exchange rate
+            price_in_ticker = price_in_local / exchange_rate
+            fee_in_ticker = fee_in_local / exchange_rate
+            total_cost_ticker = (quantity * price_in_ticker) + fee_in_ticker
+
+            f.write(TRANSACTION_ROW_TEMPLATE.format_map({
+                'ticker': transaction['ticker'].translate(HTML_ESCAPE_TABLE),
+                'purchase_date': purchase_date.translate(HTML_ESCAPE_TABLE),
+                'quantity': quantity,
+                'currency': ticker_currency.translate(HTML_ESCAPE_TABLE),
+                'price': price_in_ticker,
+                'fee': fee_in_ticker,
+                'total_cost': total_cost_ticker,
+                'total_cost_pln': total_cost_pln
+            }))
+
+        # Serialize each payload once, even where the page embeds it more than once, and
+        # write them piece by piece rather than formatting the whole script into one string
+        write_template(f, PAGE_SCRIPT_PARTS, {
+            'dates_json': dumps_json(dates),
+            'values_usd_json': dumps_json(values_usd),
+            'values_eur_json': dumps_json(values_eur),
+            'values_pln_json': dumps_json(values_pln),
+            'total_quantities_json': dumps_json(total_quantities),
+            'total_profit_values_usd_json': dumps_json(total_profit_values_usd),
+            'total_profit_values_eur_json': dumps_json(total_profit_values_eur),
+            'total_profit_values_pln_json': dumps_json(total_profit_values_pln),
+            'transaction_annotations_json': dumps_json(transaction_annotations),
+            'ticker_datasets_json': dumps_json(ticker_datasets),
+            'ticker_profit_datasets_json': dumps_json(ticker_profit_datasets),
+            'ticker_stats_json': dumps_json(ticker_stats),
+            'portfolio_values_json': dumps_json(portfolio_values),
+            'current_value_eur': current_value_eur,
+            'current_value_pln': current_value_pln,
+            'current_value_usd': current_value_usd,
+            'total_cost_basis_eur': total_cost_basis_eur,
+            'total_cost_basis_pln': total_cost_basis_pln,
+            'total_cost_basis_usd': total_cost_basis_usd,
+            'total_profit_eur': total_profit_eur,
+            'total_profit_percent_eur': total_profit_percent_eur,
+            'total_profit_percent_pln': total_profit_percent_pln,
+            'total_profit_percent_usd': total_profit_percent_usd,
+            'total_profit_pln': total_profit_pln,
+            'total_profit_usd': total_profit_usd
+        })
 
     print(f"HTML file generated: {output_file}")
 
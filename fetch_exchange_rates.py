@@ -8,8 +8,7 @@ Saves exchange rates to exchange_rates.csv for use in portfolio calculations.
 import csv
 import yfinance as yf
 from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-import os
+from portfolio_core import close_on_date, generate_month_dates, load_wide_csv
 
 
 def get_currency_pairs(filename):
@@ -17,19 +16,25 @@ def get_currency_pairs(filename):
     currencies_used = set()
     earliest_date = None
 
-    with open(filename, 'r') as f:
-        reader = csv.DictReader(f)
+    with open(filename, 'r', newline='') as f:
+        reader = csv.reader(f)
+        # Resolve the columns we need from the header once (currency columns are optional)
+        header = next(reader)
+        currency_columns = [header.index(name) for name in ('ticker_currency', 'local_currency') if name in header]
+        purchase_date_column = header.index('purchase_date')
+
         for row in reader:
-            ticker_currency = row.get('ticker_currency', '').strip()
-            local_currency = row.get('local_currency', '').strip()
+            # Skip blank lines, as csv.DictReader does
+            if not row:
+                continue
 
-            if ticker_currency:
-                currencies_used.add(ticker_currency)
-            if local_currency:
-                currencies_used.add(local_currency)
+            for column in currency_columns:
+                currency = row[column].strip()
+                if currency:
+                    currencies_used.add(currency)
 
             # Track earliest purchase date
-            purchase_date = datetime.strptime(row['purchase_date'], '%Y-%m-%d')
+            purchase_date = datetime.fromisoformat(row[purchase_date_column])
             if earliest_date is None or purchase_date < earliest_date:
                 earliest_date = purchase_date
 
@@ -46,77 +51,38 @@ def get_currency_pairs(filename):
     return sorted(list(currency_pairs)), earliest_date
 
 
-def generate_month_dates(start_date, end_date):
-    """Generate list of 1st day of each month between start and end dates."""
-    dates = []
-    current = start_date.replace(day=1)
-
-    # If start date is not the 1st, move to next month
-    if start_date.day > 1:
-        current = current + relativedelta(months=1)
-
-    while current <= end_date:
-        dates.append(current)
-        current = current + relativedelta(months=1)
-
-    return dates
-
-
-def load_existing_rates(filename):
-    """Load existing exchange rates from exchange_rates.csv if it exists."""
-    rates = {}
-
-    if not os.path.exists(filename):
-        return rates
-
-    with open(filename, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            date = row['date']
-
-            # Iterate through all columns except 'date'
-            for pair_key in row.keys():
-                if pair_key != 'date' and row[pair_key]:
-                    if pair_key not in rates:
-                        rates[pair_key] = {}
-                    rates[pair_key][date] = float(row[pair_key])
-
-    return rates
-
+def fetch_rate_history(currency_pairs, start_date, end_date):
+    """Fetch daily closes for all currency pairs in one batched yfinance download."""
+    # yfinance uses format like "USDPLN=X" for currency pairs
+    pair_symbols = [f"{from_currency}{to_currency}=X" for from_currency, to_currency in currency_pairs]
 
-def fetch_exchange_rate(from_currency, to_currency, date):
-    """Fetch exchange rate for a currency pair on a specific date using yfinance."""
     try:
-        # yfinance uses format like "USDPLN=X" for currency pairs
-        pair_symbol = f"{from_currency}{to_currency}=X"
-        ticker = yf.Ticker(pair_symbol)
-
-        # Fetch data for a small window around the target date
-        start_date = date - timedelta(days=5)
-        end_date = date + timedelta(days=5)
-
-        hist = ticker.history(start=start_date, end=end_date)
-
-        if hist.empty:
-            print(f"Warning: No data found for {from_currency}/{to_currency} around {date}")
-            return None
+        # Adjusted closes as Ticker.history() gave, always keyed by symbol first
+        data = yf.download(pair_symbols, start=start_date, end=end_date,
+                           group_by='ticker', auto_adjust=True, multi_level_index=True,
+                           progress=False, threads=True)
+    except Exception as e:
+        print(f"Error fetching exchange rates: {e}")
+        return {}
 
-        # Try to get the exact date, or the closest date
-        if date.strftime('%Y-%m-%d') in hist.index.strftime('%Y-%m-%d'):
-            return hist.loc[date.strftime('%Y-%m-%d')]['Close']
-        else:
-            # Get the closest date
-            return hist.iloc[0]['Close']
+    # {(from_currency, to_currency): ([date_str, ...], [close, ...])} in date order
+    history = {}
+    for pair, pair_symbol in zip(currency_pairs, pair_symbols):
+        if pair_symbol not in data.columns.get_level_values(0):
+            continue
+        closes = data[pair_symbol]['Close'].dropna()
+        history[pair] = (list(closes.index.strftime('%Y-%m-%d')), closes.tolist())
 
-    except Exception as e:
-        print(f"Error fetching rate for {from_currency}/{to_currency} on {date}: {e}")
-        return None
+    return history
 
 
 def fetch_and_save_rates(currency_pairs, dates, output_file='exchange_rates.csv'):
     """Fetch exchange rates for all currency pairs and dates."""
-    # Load existing rates
-    existing_rates = load_existing_rates(output_file)
+    # Generate pair keys for CSV columns
+    pair_keys = [f"{from_curr}_{to_curr}" for from_curr, to_curr in currency_pairs]
+
+    # Load existing rates (only the pairs still in use)
+    existing_rates = load_wide_csv(output_file, missing_ok=True, columns=set(pair_keys))
 
     if existing_rates:
         print(f"Found {sum(len(d) for d in existing_rates.values())} existing exchange rate entries")
@@ -126,40 +92,64 @@ def fetch_and_save_rates(currency_pairs, dates, output_file='exchange_rates.csv'
     fetch_count = 0
     skip_count = 0
 
-    # Generate pair keys for CSV columns
-    pair_keys = [f"{from_curr}_{to_curr}" for from_curr, to_curr in currency_pairs]
-
-    for date in dates:
-        date_str = date.strftime('%Y-%m-%d')
+    # Only one direction of each currency pair is quoted from yfinance (the
+    # alphabetically first one); the reverse direction is derived as 1 / rate
+    quoted_pairs = [min(pair, pair[::-1]) for pair in currency_pairs]
+
+    # Format each month's cache key once rather than once per currency pair
+    date_strs = [date.strftime('%Y-%m-%d') for date in dates]
+
+    # Work out which months are missing from the cache for each quoted pair, so fully
+    # cached pairs are not requested at all
+    missing_dates = {}
+    for pair_key, quoted_pair in zip(pair_keys, quoted_pairs):
+        cached = existing_rates.get(pair_key, {})
+        pair_missing = [date for date, date_str in zip(dates, date_strs) if date_str not in cached]
+        if pair_missing:
+            missing_dates.setdefault(quoted_pair, []).extend(pair_missing)
+
+    # Fetch the span of missing months for those pairs in a single request, then pick
+    # the monthly rates out of it below
+    history = {}
+    if missing_dates:
+        start_date = min(min(pair_missing) for pair_missing in missing_dates.values()) - timedelta(days=5)
+        end_date = max(max(pair_missing) for pair_missing in missing_dates.values()) + timedelta(days=5)
+        history = fetch_rate_history(sorted(missing_dates), start_date, end_date)
+
+    for date, date_str in zip(dates, date_strs):
         rate_data[date_str] = {}
 
-        for (from_currency, to_currency), pair_key in zip(currency_pairs, pair_keys):
+        for (from_currency, to_currency), pair_key, quoted_pair in zip(currency_pairs, pair_keys, quoted_pairs):
             # Check if we already have this rate
             if pair_key in existing_rates and date_str in existing_rates[pair_key]:
                 rate = existing_rates[pair_key][date_str]
                 skip_count += 1
             else:
-                # Fetch new rate
-                rate = fetch_exchange_rate(from_currency, to_currency, date)
+                # Use newly fetched rate (inverted for the reverse direction)
+                rate = close_on_date(history.get(quoted_pair, ([], [])), date)
+                if rate is not None and quoted_pair != (from_currency, to_currency):
+                    rate = 1.0 / rate
                 if rate is not None:
                     fetch_count += 1
                     print(f"{from_currency}/{to_currency} {date_str}: {rate:.4f}")
                 else:
+                    print(f"Warning: No data found for {from_currency}/{to_currency} around {date}")
                     continue
 
             if rate is not None:
-                rate_data[date_str][pair_key] = round(rate, 4)
+                rate_data[date_str][pair_key] = rate
 
-    # Write to CSV in wide format (date, pair1, pair2, ...)
+    # Write to CSV in wide format (date, pair1, pair2, ...), rounding rates to
+    # 4 decimal places as they are formatted
+    # (rows follow the month dates, which are generated in ascending order)
     with open(output_file, 'w', newline='') as f:
-        fieldnames = ['date'] + pair_keys
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for date_str in sorted(rate_data.keys()):
-            row = {'date': date_str}
-            row.update(rate_data[date_str])
-            writer.writerow(row)
+        writer = csv.writer(f)
+        writer.writerow(['date'] + pair_keys)
+
+        for date_str in date_strs:
+            date_rates = rate_data[date_str]
+            writer.writerow([date_str] + [f"{date_rates[pair_key]:.4f}" if pair_key in date_rates else ''
+                                          for pair_key in pair_keys])
 
     total_entries = sum(len(rates) for rates in rate_data.values())
     print(f"\n{'-' * 50}")
@@ -9,8 +9,7 @@ from Yahoo every time you add a new transaction.
 import csv
 import yfinance as yf
 from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-import os
+from portfolio_core import close_on_date, generate_month_dates, load_wide_csv
 
 
 def get_unique_tickers(filename):
@@ -26,81 +25,39 @@ def get_unique_tickers(filename):
                 tickers.add(ticker)
 
             # Track earliest purchase date
-            purchase_date = datetime.strptime(row['purchase_date'], '%Y-%m-%d')
+            purchase_date = datetime.fromisoformat(row['purchase_date'])
             if earliest_date is None or purchase_date < earliest_date:
                 earliest_date = purchase_date
 
     return sorted(list(tickers)), earliest_date
 
 
-def generate_month_dates(start_date, end_date):
-    """Generate list of 1st day of each month between start and end dates."""
-    dates = []
-    current = start_date.replace(day=1)
-
-    # If start date is not the 1st, move to next month
-    if start_date.day > 1:
-        current = current + relativedelta(months=1)
-
-    while current <= end_date:
-        dates.append(current)
-        current = current + relativedelta(months=1)
-
-    return dates
-
-
-def load_existing_prices(filename):
-    """Load existing prices from prices.csv if it exists (wide format)."""
-    prices = {}
-
-    if not os.path.exists(filename):
-        return prices
-
-    with open(filename, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            date = row['date']
-
-            # Iterate through all columns except 'date'
-            for ticker in row.keys():
-                if ticker != 'date' and row[ticker]:
-                    if ticker not in prices:
-                        prices[ticker] = {}
-                    prices[ticker][date] = float(row[ticker])
-
-    return prices
-
-
-def fetch_price(ticker, date):
-    """Fetch stock price for a specific ticker on a specific date."""
+def fetch_price_history(tickers, start_date, end_date):
+    """Fetch daily closes for all tickers in one batched yfinance download."""
     try:
-        stock = yf.Ticker(ticker)
-        # Fetch data for a small window around the target date
-        start_date = date - timedelta(days=5)
-        end_date = date + timedelta(days=5)
-
-        hist = stock.history(start=start_date, end=end_date)
-
-        if hist.empty:
-            print(f"Warning: No data found for {ticker} around {date}")
-            return None
+        # Adjusted closes as Ticker.history() gave, always keyed by ticker first
+        data = yf.download(tickers, start=start_date, end=end_date,
+                           group_by='ticker', auto_adjust=True, multi_level_index=True,
+                           progress=False, threads=True)
+    except Exception as e:
+        print(f"Error fetching prices: {e}")
+        return {}
 
-        # Try to get the exact date, or the closest date
-        if date.strftime('%Y-%m-%d') in hist.index.strftime('%Y-%m-%d'):
-            return hist.loc[date.strftime('%Y-%m-%d')]['Close']
-        else:
-            # Get the closest date
-            return hist.iloc[0]['Close']
+    # {ticker: ([date_str, ...], [close, ...])} in date order
+    history = {}
+    for ticker in tickers:
+        if ticker not in data.columns.get_level_values(0):
+            continue
+        closes = data[ticker]['Close'].dropna()
+        history[ticker] = (list(closes.index.strftime('%Y-%m-%d')), closes.tolist())
 
-    except Exception as e:
-        print(f"Error fetching price for {ticker} on {date}: {e}")
-        return None
+    return history
 
 
 def fetch_and_save_prices(tickers, dates, output_file='prices.csv'):
     """Fetch prices for all tickers and dates, merging with existing data."""
-    # Load existing prices
-    existing_prices = load_existing_prices(output_file)
+    # Load existing prices (only the tickers still in the portfolio)
+    existing_prices = load_wide_csv(output_file, missing_ok=True, columns=set(tickers))
 
     print(f"Found {sum(len(d) for d in existing_prices.values())} existing price entries")
 
@@ -109,8 +66,27 @@ def fetch_and_save_prices(tickers, dates, output_file='prices.csv'):
     fetch_count = 0
     skip_count = 0
 
-    for date in dates:
-        date_str = date.strftime('%Y-%m-%d')
+    # Format each month's cache key once rather than once per ticker
+    date_strs = [date.strftime('%Y-%m-%d') for date in dates]
+
+    # Work out which months are missing from the cache for each ticker, so fully
+    # cached tickers are not requested at all
+    missing_dates = {}
+    for ticker in tickers:
+        cached = existing_prices.get(ticker, {})
+        ticker_missing = [date for date, date_str in zip(dates, date_strs) if date_str not in cached]
+        if ticker_missing:
+            missing_dates[ticker] = ticker_missing
+
+    # Fetch the span of missing months for those tickers in a single request, then
+    # pick the monthly prices out of it below
+    history = {}
+    if missing_dates:
+        start_date = min(ticker_missing[0] for ticker_missing in missing_dates.values()) - timedelta(days=5)
+        end_date = max(ticker_missing[-1] for ticker_missing in missing_dates.values()) + timedelta(days=5)
+        history = fetch_price_history(list(missing_dates), start_date, end_date)
+
+    for date, date_str in zip(dates, date_strs):
         price_data[date_str] = {}
 
         for ticker in tickers:
@@ -119,28 +95,27 @@ def fetch_and_save_prices(tickers, dates, output_file='prices.csv'):
                 price = existing_prices[ticker][date_str]
                 skip_count += 1
             else:
-                # Fetch new price
-                price = fetch_price(ticker, date)
+                # Use newly fetched price
+                price = close_on_date(history.get(ticker, ([], [])), date)
                 if price is not None:
                     fetch_count += 1
                     print(f"{ticker} {date_str}: ${price:.2f}")
                 else:
-                    price = None
+                    print(f"Warning: No data found for {ticker} around {date}")
                     continue
 
             if price is not None:
                 price_data[date_str][ticker] = round(price, 2)
 
     # Write to CSV in wide format (date, ticker1, ticker2, ...)
+    # (rows follow the month dates, which are generated in ascending order)
     with open(output_file, 'w', newline='') as f:
-        fieldnames = ['date'] + tickers
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for date_str in sorted(price_data.keys()):
-            row = {'date': date_str}
-            row.update(price_data[date_str])
-            writer.writerow(row)
+        writer = csv.writer(f)
+        writer.writerow(['date'] + tickers)
+
+        for date_str in date_strs:
+            date_prices = price_data[date_str]
+            writer.writerow([date_str] + [date_prices.get(ticker, '') for ticker in tickers])
 
     total_entries = sum(len(prices) for prices in price_data.values())
     print(f"\n{'-' * 50}")
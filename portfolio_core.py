@@ -0,0 +1,73 @@
+"""
+Shared helpers for the fetch and prepare steps: the monthly date grid, the
+wide-format CSV caches (prices.csv, exchange_rates.csv) and picking a
+monthly value out of a daily close history.
+"""
+
+import csv
+import os
+from bisect import bisect_left
+from datetime import timedelta
+
+
+def generate_month_dates(start_date, end_date):
+    """Generate list of 1st day of each month between start and end dates."""
+    dates = []
+    # Count months as year * 12 + (month - 1) so each step is an integer increment
+    month_number = start_date.year * 12 + start_date.month - 1
+
+    # If start date is not the 1st, move to next month
+    if start_date.day > 1:
+        month_number += 1
+
+    current = start_date.replace(year=month_number // 12, month=month_number % 12 + 1, day=1)
+    while current <= end_date:
+        dates.append(current)
+        month_number += 1
+        current = start_date.replace(year=month_number // 12, month=month_number % 12 + 1, day=1)
+
+    return dates
+
+
+def load_wide_csv(filename, missing_ok=False, columns=None):
+    """Load a wide-format CSV (date, column1, column2, ...) into {column: {date: value}}, optionally only the given columns."""
+    values = {}
+
+    if missing_ok and not os.path.exists(filename):
+        return values
+
+    with open(filename, 'r', newline='') as f:
+        reader = csv.reader(f)
+        # The file is written with 'date' first, followed by the value columns;
+        # columns that were not asked for are never converted
+        header = next(reader, ['date'])
+        selected = [(index, column) for index, column in enumerate(header)
+                    if index and (columns is None or column in columns)]
+        for row in reader:
+            # Skip blank lines, as csv.DictReader does
+            if not row:
+                continue
+            date = row[0]
+            for index, column in selected:
+                if index < len(row) and row[index]:
+                    values.setdefault(column, {})[date] = float(row[index])
+
+    return values
+
+
+def close_on_date(history, date):
+    """Pick the close for a date from a (date strings, closes) history, or None if there is none nearby."""
+    date_strs, closes = history
+
+    # Try to get the exact date (binary search over the sorted trading days);
+    # isoformat()[:10] gives the same YYYY-MM-DD key as strftime, only cheaper
+    target = date.isoformat()[:10]
+    i = bisect_left(date_strs, target)
+    if i < len(date_strs) and date_strs[i] == target:
+        return closes[i]
+
+    # Otherwise get the earliest close in a small window around the target date
+    i = bisect_left(date_strs, (date - timedelta(days=5)).isoformat()[:10])
+    if i < len(date_strs) and date_strs[i] < (date + timedelta(days=5)).isoformat()[:10]:
+        return closes[i]
+    return None
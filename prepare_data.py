@@ -7,111 +7,90 @@ refetching all prices from Yahoo.
 """
 
 import csv
+import hashlib
 import json
 import os
+import sys
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
 from collections import defaultdict
+import portfolio_core
+from portfolio_core import generate_month_dates, load_wide_csv
+
+try:
+    import orjson
+except ImportError:
+    # orjson is an optional speedup; the standard library json is used without it
+    orjson = None
+
+# Everything portfolio_data.json is derived from: the input files and the code that reads them
+INPUT_FILES = ['my-tickers.csv', 'prices.csv', 'exchange_rates.csv', __file__, portfolio_core.__file__]
 
 
 def parse_transactions(filename):
     """Parse the transactions CSV file."""
     transactions = []
 
-    with open(filename, 'r') as f:
-        reader = csv.DictReader(f)
+    with open(filename, 'r', newline='') as f:
+        reader = csv.reader(f)
+        # Resolve the columns we need from the header once (currency columns are optional)
+        header = next(reader)
+        columns = {name: index for index, name in enumerate(header)}
+        ticker_column = columns['ticker']
+        purchase_date_column = columns['purchase_date']
+        ticker_currency_column = columns.get('ticker_currency')
+        local_currency_column = columns.get('local_currency')
+        quantity_column = columns['quantity']
+        price_column = columns['price_in_local_currency']
+        fee_column = columns['fee_in_local_currency']
+        exchange_rate_column = columns['exchange_rate']
+
         for row in reader:
             # Skip empty rows
-            if not row.get('ticker', '').strip():
+            ticker = row[ticker_column].strip() if len(row) > ticker_column else ''
+            if not ticker:
                 continue
 
             transactions.append({
-                'ticker': row['ticker'].strip(),
-                'purchase_date': row['purchase_date'].strip(),
-                'ticker_currency': row.get('ticker_currency', '').strip(),
-                'local_currency': row.get('local_currency', '').strip(),
-                'quantity': float(row['quantity']),
-                'price_in_local_currency': float(row['price_in_local_currency']),
-                'fee_in_local_currency': float(row['fee_in_local_currency']),
-                'exchange_rate': float(row['exchange_rate'])
+                'ticker': ticker,
+                'purchase_date': row[purchase_date_column].strip(),
+                'ticker_currency': row[ticker_currency_column].strip() if ticker_currency_column is not None else '',
+                'local_currency': row[local_currency_column].strip() if local_currency_column is not None else '',
+                'quantity': float(row[quantity_column]),
+                'price_in_local_currency': float(row[price_column]),
+                'fee_in_local_currency': float(row[fee_column]),
+                'exchange_rate': float(row[exchange_rate_column])
             })
 
     return transactions
 
 
-def load_prices(filename):
-    """Load prices from prices.csv (wide format with date and ticker columns)."""
-    prices = {}
-
-    with open(filename, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            date = row['date']
-
-            # Iterate through all columns except 'date'
-            for ticker in row.keys():
-                if ticker != 'date' and row[ticker]:
-                    if ticker not in prices:
-                        prices[ticker] = {}
-                    prices[ticker][date] = float(row[ticker])
-
-    return prices
-
-
-def load_exchange_rates(filename):
-    """Load exchange rates from exchange_rates.csv."""
-    rates = {}
-
-    if not os.path.exists(filename):
-        return rates
-
-    with open(filename, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            date = row['date']
-
-            # Iterate through all columns except 'date'
-            for pair_key in row.keys():
-                if pair_key != 'date' and row[pair_key]:
-                    if pair_key not in rates:
-                        rates[pair_key] = {}
-                    rates[pair_key][date] = float(row[pair_key])
-
-    return rates
-
-
 def get_earliest_date(transactions):
     """Get the earliest purchase date from transactions."""
-    dates = [datetime.strptime(t['purchase_date'], '%Y-%m-%d') for t in transactions]
-    return min(dates)
-
-
-def generate_month_dates(start_date, end_date):
-    """Generate list of 1st day of each month between start and end dates."""
-    dates = []
-    current = start_date.replace(day=1)
-
-    # If start date is not the 1st, move to next month
-    if start_date.day > 1:
-        current = current + relativedelta(months=1)
-
-    while current <= end_date:
-        dates.append(current)
-        current = current + relativedelta(months=1)
-
-    return dates
-
-
-def get_holdings_at_date(transactions, target_date):
-    """Calculate total holdings of each ticker up to the target date."""
+    # ISO dates sort chronologically as strings, so only the earliest one is parsed
+    return datetime.fromisoformat(min(t['purchase_date'] for t in transactions))
+
+
+def holdings_over_time(transactions, dates):
+    """Yield the total holdings of each ticker up to each of the (sorted) dates."""
+    # Walk the transactions in date order alongside the dates, so each transaction is
+    # added to the running totals exactly once
+    dated_transactions = sorted(
+        ((datetime.fromisoformat(t['purchase_date']), index, t['ticker'], t['quantity'])
+         for index, t in enumerate(transactions)),
+        key=lambda t: t[0])
     holdings = defaultdict(float)
+    # Position in the transactions file of each ticker's first transaction seen so far;
+    # holdings are listed in that order
+    first_index = {}
+    i = 0
 
-    for transaction in transactions:
-        trans_date = datetime.strptime(transaction['purchase_date'], '%Y-%m-%d')
-        if trans_date <= target_date:
-            holdings[transaction['ticker']] += transaction['quantity']
-
-    return dict(holdings)
+    for target_date in dates:
+        while i < len(dated_transactions) and dated_transactions[i][0] <= target_date:
+            _, index, ticker, quantity = dated_transactions[i]
+            holdings[ticker] += quantity
+            first_index[ticker] = min(index, first_index.get(ticker, index))
+            i += 1
+        yield {ticker: holdings[ticker] for ticker in sorted(holdings, key=first_index.get)}
 
 
 def convert_value(value, from_currency, to_currency, exchange_rates, date_str):
@@ -120,8 +99,8 @@ def convert_value(value, from_currency, to_currency, exchange_rates, date_str):
         return value
 
     pair_key = f"{from_currency}_{to_currency}"
-    if pair_key in exchange_rates and date_str in exchange_rates[pair_key]:
-        exchange_rate = exchange_rates[pair_key][date_str]
+    exchange_rate = exchange_rates.get(pair_key, {}).get(date_str)
+    if exchange_rate is not None:
         return value * exchange_rate
     else:
         print(f"  Warning: No exchange rate for {pair_key} on {date_str}")
@@ -142,9 +121,8 @@ def prepare_portfolio_data(transactions, prices, exchange_rates, dates):
                 'local_currency': transaction['local_currency']
             }
 
-    for date in dates:
+    for date, holdings in zip(dates, holdings_over_time(transactions, dates)):
         date_str = date.strftime('%Y-%m-%d')
-        holdings = get_holdings_at_date(transactions, date)
 
         date_data = {
             'date': date_str,
@@ -154,13 +132,15 @@ def prepare_portfolio_data(transactions, prices, exchange_rates, dates):
             'total_value_pln': 0
         }
 
-        print(f"Processing {date_str}...")
+        # Factors converting each ticker currency to (USD, EUR, PLN) on this date,
+        # looked up once per currency rather than three times per holding
+        display_rates = {}
 
         for ticker, quantity in holdings.items():
-            # Look up price from prices.csv
-            if ticker in prices and date_str in prices[ticker]:
-                price = prices[ticker][date_str]
-
+            # Look up price from prices.csv (one .get per level instead of two
+            # membership tests and two lookups)
+            price = prices.get(ticker, {}).get(date_str)
+            if price is not None:
                 # Get currency info for this ticker
                 currency_info = ticker_currency_map.get(ticker, {})
                 ticker_currency = currency_info.get('ticker_currency', 'USD')
@@ -170,16 +150,19 @@ def prepare_portfolio_data(transactions, prices, exchange_rates, dates):
                 value_original = quantity * price
 
                 # Convert to all three display currencies
-                price_usd = convert_value(price, ticker_currency, 'USD', exchange_rates, date_str)
-                price_eur = convert_value(price, ticker_currency, 'EUR', exchange_rates, date_str)
-                price_pln = convert_value(price, ticker_currency, 'PLN', exchange_rates, date_str)
+                if ticker_currency not in display_rates:
+                    display_rates[ticker_currency] = tuple(
+                        convert_value(1.0, ticker_currency, display_currency, exchange_rates, date_str)
+                        for display_currency in ('USD', 'EUR', 'PLN'))
+                usd_rate, eur_rate, pln_rate = display_rates[ticker_currency]
+                price_usd = price * usd_rate
+                price_eur = price * eur_rate
+                price_pln = price * pln_rate
 
                 value_usd = quantity * price_usd
                 value_eur = quantity * price_eur
                 value_pln = quantity * price_pln
 
-                print(f"  {ticker}: {quantity} shares × {price:.2f} {ticker_currency} = {value_usd:.2f} USD, {value_eur:.2f} EUR, {value_pln:.2f} PLN")
-
                 date_data['holdings'].append({
                     'ticker': ticker,
                     'quantity': quantity,
@@ -204,21 +187,50 @@ def prepare_portfolio_data(transactions, prices, exchange_rates, dates):
         date_data['total_value_eur'] = round(date_data['total_value_eur'], 2)
         date_data['total_value_pln'] = round(date_data['total_value_pln'], 2)
         portfolio_data.append(date_data)
-        print(f"  Total: {date_data['total_value_usd']:.2f} USD, {date_data['total_value_eur']:.2f} EUR, {date_data['total_value_pln']:.2f} PLN\n")
+        # One summary line per date; the per-holding breakdown is in portfolio_data.json
+        print(f"{date_str}: {date_data['total_value_usd']:.2f} USD, {date_data['total_value_eur']:.2f} EUR, {date_data['total_value_pln']:.2f} PLN")
 
     return portfolio_data
 
 
-def save_portfolio_data(transactions, portfolio_data, output_file='portfolio_data.json'):
+def input_fingerprint(filenames, today):
+    """Hash the input files together with the current month, which ends the monthly date range."""
+    h = hashlib.blake2b()
+    h.update(today.strftime('%Y-%m').encode())
+    for filename in filenames:
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                h.update(f.read())
+        # Separate the files so moving bytes from one to the next changes the hash
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def load_input_hash(output_file='portfolio_data.json'):
+    """Return the input hash recorded in an existing portfolio_data.json, or None."""
+    try:
+        with open(output_file, 'rb') as f:
+            return json.loads(f.read()).get('input_hash')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def save_portfolio_data(transactions, portfolio_data, input_hash, output_file='portfolio_data.json'):
     """Save portfolio data to JSON file for inspection and later use."""
     output = {
         'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'input_hash': input_hash,
         'transactions': transactions,
         'portfolio_values': portfolio_data
     }
 
-    with open(output_file, 'w') as f:
-        json.dump(output, f, indent=2)
+    # Written compactly; 'make view-data' pretty-prints it for inspection
+    if orjson is not None:
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(output))
+    else:
+        with open(output_file, 'w') as f:
+            json.dump(output, f, separators=(',', ':'), ensure_ascii=False)
 
     print(f"Portfolio data saved to: {output_file}")
 
@@ -228,20 +240,27 @@ def main():
     print("Portfolio Data Preparation - Step 2")
     print("=" * 50)
 
+    # Nothing to do if the inputs are the same as for the existing portfolio_data.json
+    today = datetime.now()
+    input_hash = input_fingerprint(INPUT_FILES, today)
+    if input_hash == load_input_hash():
+        print("\nInputs unchanged since portfolio_data.json was generated, skipping")
+        return
+
     # Check if prices.csv exists
     try:
         print("\n1. Loading prices from prices.csv...")
-        prices = load_prices('prices.csv')
+        prices = load_wide_csv('prices.csv')
         total_prices = sum(len(dates) for dates in prices.values())
         print(f"   Loaded {total_prices} price entries for {len(prices)} tickers")
     except FileNotFoundError:
         print("Error: prices.csv not found!")
         print("Please run 'make fetch' first to fetch prices from Yahoo Finance.")
-        exit(1)
+        sys.exit(1)
 
     # Load exchange rates
     print("\n2. Loading exchange rates from exchange_rates.csv...")
-    exchange_rates = load_exchange_rates('exchange_rates.csv')
+    exchange_rates = load_wide_csv('exchange_rates.csv', missing_ok=True)
     if exchange_rates:
         total_rates = sum(len(dates) for dates in exchange_rates.values())
         print(f"   Loaded {total_rates} exchange rate entries for {len(exchange_rates)} currency pairs")
@@ -256,7 +275,6 @@ def main():
     # Get date range
     print("\n4. Determining date range...")
     earliest_date = get_earliest_date(transactions)
-    today = datetime.now()
     print(f"   Earliest purchase: {earliest_date.strftime('%Y-%m-%d')}")
     print(f"   Today: {today.strftime('%Y-%m-%d')}")
 
@@ -271,7 +289,7 @@ def main():
 
     # Save to JSON
     print("\n7. Saving data to JSON file...")
-    save_portfolio_data(transactions, portfolio_data)
+    save_portfolio_data(transactions, portfolio_data, input_hash)
 
     print("\n" + "=" * 50)
     print("Done! Data saved to portfolio_data.json")